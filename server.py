@@ -15,8 +15,9 @@ MCP 的核心概念：
 本示例实现了一个简单的 Tool，返回"超人"的基本信息。
 
 传输方式：
-MCP 支持多种传输方式：stdio、HTTP+SSE 等
-本示例使用 HTTP + SSE (Server-Sent Events) 方式
+MCP 支持多种传输方式：stdio、Streamable HTTP、HTTP+SSE 等
+本示例使用 Streamable HTTP 方式（MCP 2025-03-26 规范推荐），
+同时保留旧版 HTTP + SSE (Server-Sent Events) 端点以兼容老客户端
 
 运行方式：
     python server.py
@@ -30,11 +31,9 @@ MCP 支持多种传输方式：stdio、HTTP+SSE 等
 
 # Starlette - 轻量级 ASGI 框架（FastAPI 的底层框架）
 from starlette.applications import Starlette
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from starlette.routing import Route
 from starlette.middleware import Middleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
 
 # MCP SDK - 提供 MCP 协议的核心实现
 from mcp.server.fastmcp import FastMCP
@@ -45,12 +44,21 @@ import uvicorn
 # 类型注解支持
 from typing import Literal
 
-# 日期时间
-from datetime import datetime
+# 时间（用于健康检查时间戳）
+import time
+
+# orjson - 高性能 JSON 序列化库（比标准库 json 快数倍，直接输出 bytes）
+import orjson
+
+# 缓存工具
+from functools import lru_cache
 
 # 环境变量
 import os
 
+# 常量时间比较，防止 token 校验的时序侧信道
+import hmac
+
 # ============================================================================
 # 配置常量
 # ============================================================================
@@ -58,6 +66,12 @@ import os
 # 服务器监听端口（支持 Cloud Run 的 PORT 环境变量）
 PORT = int(os.environ.get("PORT", 3000))
 
+# uvicorn 工作进程数（支持常见的 WEB_CONCURRENCY 环境变量）
+# 多个进程共享同一个监听 socket，由内核在进程间分配连接，可利用多核 CPU
+# 默认 1：旧版 SSE 传输的会话保存在进程内存中，多进程时 /messages 请求
+# 可能落到另一个进程上；只使用 Streamable HTTP 时可以放心调大
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+
 # 服务器名称（会在 MCP 握手时发送给客户端）
 SERVER_NAME = "superman-mcp-server"
 
@@ -65,54 +79,104 @@ SERVER_NAME = "superman-mcp-server"
 # 在生产环境中，应该从环境变量或安全存储中读取
 AUTH_TOKEN = "fz-test-123456"
 
+# 完整的期望 Authorization header（预先编码为 bytes，校验时直接整体比较）
+_EXPECTED_AUTH = ("Bearer " + AUTH_TOKEN).encode("latin-1")
+
 # 不需要身份验证的路径（如健康检查）
-PUBLIC_PATHS = ["/health"]
+# 使用 frozenset，每个请求的成员判断都是 O(1)
+PUBLIC_PATHS = frozenset({"/health"})
+
+
+# ============================================================================
+# JSON 响应
+# ============================================================================
+
+class ORJSONResponse(JSONResponse):
+    """
+    使用 orjson 序列化的 JSONResponse
+
+    Starlette 默认的 JSONResponse 使用标准库 json.dumps 再编码成 bytes，
+    orjson 直接输出 UTF-8 bytes，速度更快
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# 身份验证失败时的 401 响应
+# 内容固定不变，在模块加载时构建一次；Response 对象可以被重复发送
+_MISSING_AUTH_RESPONSE = ORJSONResponse(
+    {"error": "Missing Authorization header"},
+    status_code=401
+)
+_BAD_AUTH_FORMAT_RESPONSE = ORJSONResponse(
+    {"error": "Invalid Authorization header format. Expected: Bearer <token>"},
+    status_code=401
+)
+_BAD_TOKEN_RESPONSE = ORJSONResponse(
+    {"error": "Invalid token"},
+    status_code=401
+)
 
 
 # ============================================================================
 # 身份验证中间件
 # ============================================================================
 
-class AuthMiddleware(BaseHTTPMiddleware):
+class AuthMiddleware:
     """
     Bearer Token 身份验证中间件
 
     检查请求头中的 Authorization 字段，验证 Bearer token 是否正确。
     对于 PUBLIC_PATHS 中的路径，跳过验证。
+
+    这是一个纯 ASGI 中间件：直接读取 scope，而不是继承 BaseHTTPMiddleware。
+    BaseHTTPMiddleware 会为每个请求创建额外的任务和内存流，
+    对 SSE 等流式响应既慢又会破坏背压。
     """
 
-    async def dispatch(self, request: Request, call_next):
-        # 检查是否是公开路径（不需要验证）
-        if request.url.path in PUBLIC_PATHS:
-            return await call_next(request)
+    def __init__(self, app):
+        self.app = app
 
-        # 获取 Authorization header
-        auth_header = request.headers.get("Authorization")
+    async def __call__(self, scope, receive, send):
+        # 只处理 HTTP 请求，lifespan 等其他类型直接放行
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # 健康检查快速通道：负载均衡器 / 探针的 GET、HEAD 请求直接在这里响应，
+        # 不再经过后续的路由匹配
+        # （HEAD 请求的响应体由 ASGI 服务器丢弃，只返回响应头）
+        if scope["path"] == "/health" and scope["method"] in ("GET", "HEAD"):
+            return await _health_response(int(time.time()))(scope, receive, send)
+
+        # 检查是否是公开路径（不需要验证）
+        if scope["path"] in PUBLIC_PATHS:
+            return await self.app(scope, receive, send)
+
+        # 获取 Authorization header（原始 bytes）
+        # ASGI 服务器已将 header 名转为小写，直接扫描 scope["headers"]，
+        # 找到后立即停止，不需要构造 Headers 对象
+        auth_header = None
+        for key, value in scope["headers"]:
+            if key == b"authorization":
+                auth_header = value
+                break
 
         # 验证 Authorization header 格式和 token
         if not auth_header:
-            return JSONResponse(
-                {"error": "Missing Authorization header"},
-                status_code=401
-            )
+            return await _MISSING_AUTH_RESPONSE(scope, receive, send)
 
         # 检查是否是 Bearer token 格式
-        if not auth_header.startswith("Bearer "):
-            return JSONResponse(
-                {"error": "Invalid Authorization header format. Expected: Bearer <token>"},
-                status_code=401
-            )
-
-        # 提取并验证 token
-        token = auth_header[7:]  # 去掉 "Bearer " 前缀
-        if token != AUTH_TOKEN:
-            return JSONResponse(
-                {"error": "Invalid token"},
-                status_code=401
-            )
+        if not auth_header.startswith(b"Bearer "):
+            return await _BAD_AUTH_FORMAT_RESPONSE(scope, receive, send)
+
+        # 验证 token：整体比较原始 header 字节，
+        # hmac.compare_digest 的耗时与内容无关，不会泄露 token 的匹配长度
+        if not hmac.compare_digest(auth_header, _EXPECTED_AUTH):
+            return await _BAD_TOKEN_RESPONSE(scope, receive, send)
 
         # 验证通过，继续处理请求
-        return await call_next(request)
+        await self.app(scope, receive, send)
 
 # ============================================================================
 # 超人的基本信息数据
@@ -178,6 +242,55 @@ SUPERMAN_INFO = {
 }
 
 
+# ============================================================================
+# 按类别预先构建的信息切片
+# ============================================================================
+
+# SUPERMAN_INFO 在运行期间不会变化，因此各个类别的子集只需在模块加载时构建一次，
+# 工具被调用时直接返回，无需每次都重新拼装字典
+
+# 基本身份信息（姓名、外貌、关联角色等）
+SUPERMAN_BASIC_INFO = {
+    "name": SUPERMAN_INFO["name"],
+    "realName": SUPERMAN_INFO["realName"],
+    "alias": SUPERMAN_INFO["alias"],
+    "publisher": SUPERMAN_INFO["publisher"],
+    "firstAppearance": SUPERMAN_INFO["firstAppearance"],
+    "creators": SUPERMAN_INFO["creators"],
+    "appearance": SUPERMAN_INFO["appearance"],
+    "associates": SUPERMAN_INFO["associates"],
+    "motto": SUPERMAN_INFO["motto"]
+}
+
+# 超能力列表
+SUPERMAN_POWERS_INFO = {
+    "name": SUPERMAN_INFO["name"],
+    "powers": SUPERMAN_INFO["powers"]
+}
+
+# 起源故事
+SUPERMAN_ORIGIN_INFO = {
+    "name": SUPERMAN_INFO["name"],
+    "alias": SUPERMAN_INFO["alias"],
+    "origin": SUPERMAN_INFO["origin"]
+}
+
+# 弱点信息
+SUPERMAN_WEAKNESSES_INFO = {
+    "name": SUPERMAN_INFO["name"],
+    "weaknesses": SUPERMAN_INFO["weaknesses"]
+}
+
+# 类别 -> 信息切片的映射，工具通过一次字典查找完成分发
+SUPERMAN_INFO_BY_CATEGORY = {
+    "all": SUPERMAN_INFO,
+    "basic": SUPERMAN_BASIC_INFO,
+    "powers": SUPERMAN_POWERS_INFO,
+    "origin": SUPERMAN_ORIGIN_INFO,
+    "weaknesses": SUPERMAN_WEAKNESSES_INFO
+}
+
+
 # ============================================================================
 # 创建 MCP 服务器实例
 # ============================================================================
@@ -189,7 +302,19 @@ SUPERMAN_INFO = {
 # - name: 服务器名称，用于标识这个 MCP 服务器
 # - host: 设置为 "0.0.0.0" 禁用默认的 DNS rebinding protection
 #         （默认 "127.0.0.1" 会限制只允许 localhost 相关的 Host header）
-mcp = FastMCP(SERVER_NAME, host="0.0.0.0")
+# - json_response: Streamable HTTP 直接以单个 application/json 响应体返回结果，
+#         而不是 SSE 的 "event: message" 帧（本服务器的工具都是同步短调用）
+# - stateless_http: Streamable HTTP 不在进程内保存会话，
+#         每个请求都可以由任意一个 uvicorn 工作进程处理
+# - log_level: FastMCP 默认在 INFO 级别为每个 MCP 请求输出日志，
+#         与 uvicorn 保持一致只输出 WARNING 及以上级别
+mcp = FastMCP(
+    SERVER_NAME,
+    host="0.0.0.0",
+    json_response=True,
+    stateless_http=True,
+    log_level="WARNING"
+)
 
 
 # ============================================================================
@@ -234,85 +359,70 @@ def get_superman_info(
         get_superman_info(category="powers")
     """
 
-    # 根据请求的类别返回不同的信息
-    if category == "basic":
-        # 只返回基本身份信息
-        return {
-            "name": SUPERMAN_INFO["name"],
-            "realName": SUPERMAN_INFO["realName"],
-            "alias": SUPERMAN_INFO["alias"],
-            "publisher": SUPERMAN_INFO["publisher"],
-            "firstAppearance": SUPERMAN_INFO["firstAppearance"],
-            "creators": SUPERMAN_INFO["creators"],
-            "appearance": SUPERMAN_INFO["appearance"],
-            "associates": SUPERMAN_INFO["associates"],
-            "motto": SUPERMAN_INFO["motto"]
-        }
-
-    elif category == "powers":
-        # 只返回超能力列表
-        return {
-            "name": SUPERMAN_INFO["name"],
-            "powers": SUPERMAN_INFO["powers"]
-        }
-
-    elif category == "origin":
-        # 只返回起源故事
-        return {
-            "name": SUPERMAN_INFO["name"],
-            "alias": SUPERMAN_INFO["alias"],
-            "origin": SUPERMAN_INFO["origin"]
-        }
-
-    elif category == "weaknesses":
-        # 只返回弱点信息
-        return {
-            "name": SUPERMAN_INFO["name"],
-            "weaknesses": SUPERMAN_INFO["weaknesses"]
-        }
-
-    else:  # category == "all" 或其他情况
-        # 返回全部信息
-        return SUPERMAN_INFO
+    # 根据请求的类别返回预先构建好的信息切片
+    # 未知类别与 "all" 一样返回全部信息
+    return SUPERMAN_INFO_BY_CATEGORY.get(category, SUPERMAN_INFO)
 
 
 # ============================================================================
 # 自定义 HTTP 端点处理函数
 # ============================================================================
 
+# 服务器信息（根路径响应体）
+# 内容在运行期间完全不变，因此在模块加载时序列化一次，每次请求直接返回 bytes
+_ROOT_JSON = orjson.dumps({
+    "name": SERVER_NAME,
+    "version": "1.0.0",
+    "description": "这是一个简单的 MCP 服务器示例，提供超人信息查询功能",
+    "endpoints": {
+        "/": "服务器信息（当前页面）",
+        "/mcp": "Streamable HTTP 端点 (POST) - 发送 MCP 消息",
+        "/sse": "旧版 SSE 连接端点 (GET) - 兼容老客户端",
+        "/messages": "旧版消息端点 (POST) - 配合 /sse 使用",
+        "/health": "健康检查端点 (GET)"
+    },
+    "tool": {
+        "name": "get_superman_info",
+        "description": "获取超人的详细信息",
+        "parameters": {
+            "category": {
+                "type": "string",
+                "options": ["all", "basic", "powers", "origin", "weaknesses"],
+                "default": "all"
+            }
+        }
+    },
+    "usage": {
+        "step1": "使用 POST /mcp 发送 initialize 请求",
+        "step2": "使用 POST /mcp 发送 tools/list 请求查看可用工具",
+        "step3": "使用 POST /mcp 发送 tools/call 请求调用工具（服务器无状态，无需会话 ID）"
+    }
+})
+
+
 async def root(request):
     """
     根路径 - 显示服务器基本信息和使用说明
 
     这个端点提供了服务器的概览信息，帮助用户了解如何使用此 MCP 服务器
     """
-    return JSONResponse({
-        "name": SERVER_NAME,
+    return Response(_ROOT_JSON, media_type="application/json")
+
+
+@lru_cache(maxsize=1)
+def _health_response(second):
+    """
+    生成健康检查的响应（按秒缓存）
+
+    除时间戳外内容都是固定的，而探针可能每秒请求多次，
+    因此同一秒内直接复用已构建好的 Response（Response 对象可以被重复发送）
+    """
+    return Response(orjson.dumps({
+        "status": "ok",
+        "server": SERVER_NAME,
         "version": "1.0.0",
-        "description": "这是一个简单的 MCP 服务器示例，提供超人信息查询功能",
-        "endpoints": {
-            "/": "服务器信息（当前页面）",
-            "/sse": "SSE 连接端点 (GET) - 建立 MCP 连接",
-            "/messages": "消息端点 (POST) - 发送 MCP 消息",
-            "/health": "健康检查端点 (GET)"
-        },
-        "tool": {
-            "name": "get_superman_info",
-            "description": "获取超人的详细信息",
-            "parameters": {
-                "category": {
-                    "type": "string",
-                    "options": ["all", "basic", "powers", "origin", "weaknesses"],
-                    "default": "all"
-                }
-            }
-        },
-        "usage": {
-            "step1": "使用 GET /sse 建立 SSE 连接",
-            "step2": "从 SSE 事件中获取 endpoint URL",
-            "step3": "使用 POST /messages 发送 MCP 消息"
-        }
-    })
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(second))
+    }), media_type="application/json")
 
 
 async def health_check(request):
@@ -322,38 +432,44 @@ async def health_check(request):
     用于检查服务器是否正常运行
     这是一个常见的最佳实践，方便监控和负载均衡器使用
     """
-    return JSONResponse({
-        "status": "ok",
-        "server": SERVER_NAME,
-        "version": "1.0.0",
-        "timestamp": datetime.now().isoformat()
-    })
+    return _health_response(int(time.time()))
 
 
 # ============================================================================
 # 创建 Starlette 应用并集成 MCP
 # ============================================================================
 
-# 获取 FastMCP 内置的 SSE 应用
-# mcp.sse_app() 返回一个配置好 MCP SSE 传输的 Starlette 应用
-# 它自动处理 /sse 和 /messages 端点
-mcp_app = mcp.sse_app()
-
-# 定义自定义路由
-# 这些路由提供额外的 HTTP 端点，用于服务器信息和健康检查
-custom_routes = [
-    Route("/", root),           # 根路径 - 服务器信息
+# 获取 FastMCP 内置的 Streamable HTTP 应用
+# mcp.streamable_http_app() 返回一个配置好 Streamable HTTP 传输的 Starlette 应用
+# 它自动处理 /mcp 端点
+mcp_app = mcp.streamable_http_app()
+
+# 旧版 SSE 应用，仅为兼容尚未支持 Streamable HTTP 的老客户端而保留
+# mcp.sse_app() 自动处理 /sse 和 /messages 端点
+sse_app = mcp.sse_app()
+
+# 定义完整的路由表
+# Starlette 按顺序逐个匹配路由，因此把请求量最大的 MCP 端点放在最前面，
+# 其次是自定义的服务器信息和健康检查端点（GET/HEAD /health 通常已由中间件直接响应），
+# 最后是仅为兼容保留的旧版 SSE 端点
+routes = [
+    *mcp_app.routes,                 # Streamable HTTP 端点 - /mcp
+    Route("/", root),                # 根路径 - 服务器信息
     Route("/health", health_check),  # 健康检查端点
+    *sse_app.routes,                 # 旧版 SSE 端点 - /sse 和 /messages
 ]
 
 # 创建主应用
-# 将自定义路由添加到 MCP 应用的路由列表中
-# 这样可以在同一个服务器上同时提供 MCP 功能和自定义 HTTP 端点
+# 在同一个服务器上同时提供 MCP 功能和自定义 HTTP 端点
+#
+# 注意：Streamable HTTP 的会话管理器需要在应用生命周期内运行，
+# 只合并路由时不会带上 mcp_app 的 lifespan，因此这里需要显式指定
 app = Starlette(
-    routes=custom_routes + mcp_app.routes,  # 合并自定义路由和 MCP 路由
+    routes=routes,
     middleware=[
         Middleware(AuthMiddleware)  # 添加身份验证中间件
-    ]
+    ],
+    lifespan=lambda app: mcp.session_manager.run()
 )
 
 
@@ -367,8 +483,8 @@ if __name__ == "__main__":
     print("🦸 超人 MCP 服务器已启动！")
     print("=" * 60)
     print(f"📡 服务器地址: http://localhost:{PORT}")
-    print(f"🔗 SSE 端点:   http://localhost:{PORT}/sse")
-    print(f"📨 消息端点:   http://localhost:{PORT}/messages")
+    print(f"🔗 MCP 端点:   http://localhost:{PORT}/mcp")
+    print(f"🕰️  旧版 SSE:   http://localhost:{PORT}/sse (消息端点 /messages)")
     print(f"❤️  健康检查:   http://localhost:{PORT}/health")
     print("=" * 60)
     print("🔐 身份验证: 需要在请求头中添加")
@@ -382,7 +498,21 @@ if __name__ == "__main__":
 
     # 使用 uvicorn 启动 ASGI 服务器
     # 参数说明：
-    # - app: Starlette 应用实例
+    # - app: 单进程时直接传入 Starlette 应用实例；多进程时必须传入导入路径 "server:app"，
+    #        由每个工作进程自行导入（单进程也用导入路径会让 server.py 被再执行一遍）
     # - host: 监听地址，"0.0.0.0" 表示接受所有网络接口的连接
     # - port: 监听端口
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    # - workers: 工作进程数
+    # - loop: 事件循环实现，"auto" 在安装了 uvloop 时优先使用它（Windows 不支持 uvloop）
+    # - http: HTTP 解析器，"auto" 在安装了 httptools 时优先使用它（比纯 Python 的 h11 快）
+    # - log_level / access_log: 关闭逐请求的访问日志，避免每个请求都格式化并输出一行日志
+    uvicorn.run(
+        app if WEB_CONCURRENCY == 1 else "server:app",
+        host="0.0.0.0",
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        loop="auto",
+        http="auto",
+        log_level="warning",
+        access_log=False
+    )